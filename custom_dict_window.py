@@ -1,11 +1,10 @@
 # -*- coding: utf-8 -*-
 import gtk
+import gobject
 import pango
 import php
 import os
 import sys
-reload(sys)
-sys.setdefaultencoding("utf-8")
 my = php.kit()
 import myi18n
 
@@ -14,52 +13,162 @@ my18 = myi18n.kit()
 PWD = os.path.dirname(os.path.realpath(sys.argv[0]))
 # custom_dict_window.py
 import json
+import hashlib
+from collections import OrderedDict
+
+
+CUSTOM_JSON_PATH = os.path.join(PWD, "custom.json")
+# custom.json 讀寫用的緩衝區大小，預設 8 KiB 太小
+IO_BUFFER_SIZE = 128 * 1024
+# 連續編輯時合併寫入，第一筆修改後這麼久(ms)才寫 custom.json
+SAVE_DELAY_MS = 200
+
+# custom.json 編解碼：有 ujson 就用，沒有就退回標準 json
+# 兩邊都排序、縮排 4 格、不跳脫中文；ujson 冒號後不留空白、預設會跳脫 /，
+# json 這邊用相同的 separators、ujson 關掉 / 跳脫，寫出來的檔案才會一個 byte 都不差
+try:
+    import ujson
+
+    _json_loads = ujson.loads
+
+    def _json_dumps(data):
+        return ujson.dumps(
+            data,
+            ensure_ascii=False,
+            escape_forward_slashes=False,
+            indent=4,
+            sort_keys=True,
+        )
+
+except ImportError:
+    _json_loads = json.loads
+
+    def _json_dumps(data):
+        return json.dumps(
+            data, ensure_ascii=False, indent=4, sort_keys=True, separators=(",", ":")
+        )
 
 
-CUSTOM_JSON_PATH = "%s\\custom.json" % PWD
+def _u(s):
+    # PyGTK 取回的是 utf-8 str，json 載入的是 unicode，統一成 unicode 才能當 dict key 比對
+    if isinstance(s, str):
+        return s.decode("utf-8")
+    return s
+
+
+# 翻譯只在載入模組時做一次，結果存成下面的常數
+# myi18n 的 key 是 utf-8 str，查完轉成 unicode，跟 unicode 的字根、出字詞組字串時才不用隱含轉碼
+def _T(s):
+    return _u(my18.auto(s))
+
+
+LABEL_TITLE = _T("肥米自定字詞功能")
+LABEL_KEY = _T("字根：")
+LABEL_WORDS = _T("出字詞：")
+LABEL_SAVE = _T("儲存")
+LABEL_PROMPT_PRE = _T("請選擇要對「")
+LABEL_PROMPT_POST = _T("」做什麼？")
+LABEL_EDIT = _T("編輯")
+LABEL_DELETE = _T("刪除")
+LABEL_MOVE_UP = _T("上移")
+LABEL_MOVE_DOWN = _T("下移")
+LABEL_CANCEL = _T("取消")
+COL_TITLES = [_T("項次"), _T("字根"), _T("字詞(點二下可以編修)")]
+# 表格欄寬固定，配合 fixed-height-mode 不必逐列量測
+COL_WIDTHS = [70, 110, 370]
+
+# Issue 197、自定詞庫功能 字根只能允許 a-z,.]['
+# entry 取回的是 utf-8 str，把其它 byte 全部列為刪除字元，交給 str.translate 一次濾掉
+ALLOWED_KEY_CHARS = "abcdefghijklmnopqrstuvwxyz,.]['"
+_DROP_KEY_CHARS = "".join(
+    [chr(i) for i in range(256) if chr(i) not in ALLOWED_KEY_CHARS]
+)
+
+
+def _read_json_file(path):
+    # 回傳 (資料, 檔案內容 md5)，空檔回傳 (None, None)
+    # ujson / json 都要整段字串才能解析，mmap 只會多一次複製，直接 read 一次就好
+    with open(path, "rb", IO_BUFFER_SIZE) as f:
+        content = f.read()
+    if not content:
+        return None, None
+    return _json_loads(content), hashlib.md5(content).digest()
+
+
+def _replace_file(src, dst):
+    # Python 2 沒有 os.replace，Windows 上 os.rename 遇到目的檔已存在會失敗
+    if hasattr(os, "replace"):
+        os.replace(src, dst)
+    elif os.name == "nt":
+        import ctypes
+
+        MOVEFILE_REPLACE_EXISTING = 0x1
+        kernel32 = ctypes.windll.kernel32
+        move = kernel32.MoveFileExW if isinstance(src, unicode) else kernel32.MoveFileExA
+        if not move(src, dst, MOVEFILE_REPLACE_EXISTING):
+            raise ctypes.WinError()
+    else:
+        os.rename(src, dst)
 
 
 class CustomDictWindow(object):
 
-    custom_UI = {
-        "parent": None,  # 父視窗
-        "data": {},  # 儲存自定字詞的資料
-        "lastKey": None,  # 編輯用
-        "lastValue": None,  # 編輯用
-        "isEdit": False,  # 編輯用
-        "win": None,
-        "entry_key": None,
-        "text_words": None,
-        "btn_save": None,
-        "model": None,
-    }
+    __slots__ = (
+        "parent",
+        "data",
+        "lastKey",
+        "lastValue",
+        "isEdit",
+        "win",
+        "entry_key",
+        "text_words",
+        "text_buffer",
+        "btn_save",
+        "treeview",
+        "model",
+        "iters",
+        "_dirty",
+        "_save_source_id",
+        "_last_hash",
+        "_index",
+        "_action_dialog",
+        "_action_buttons",
+        "_entry_changed_id",
+        "_fd_entry",
+        "_fd_cell",
+        "_fd_dialog",
+    )
 
     def __init__(self, parent=None):
+        self.parent = parent  # 父視窗
+        self._init_state()
         self.load_data()
         # print(self)
         # print(parent);
         # self.win = parent
         # if self.win is None:
-        self.custom_UI["parent"] = parent
-        self.custom_UI["win"] = gtk.Window(type=gtk.WINDOW_TOPLEVEL)
-        self.custom_UI["win"].set_modal(True)
-        self.custom_UI["win"].set_title(my18.auto("肥米自定字詞功能"))
-        self.custom_UI["win"].set_size_request(600, 400)
+        # 字型只解析一次，之後重複使用
+        self._fd_entry = pango.FontDescription("Consolas bold 18")
+        self._fd_cell = pango.FontDescription("%s 12" % parent.GLOBAL_FONT_FAMILY)
+        self._fd_dialog = pango.FontDescription("%s 14" % parent.GLOBAL_FONT_FAMILY)
+        self.win = gtk.Window(type=gtk.WINDOW_TOPLEVEL)
+        self.win.set_modal(True)
+        self.win.set_title(LABEL_TITLE)
+        self.win.set_size_request(600, 400)
 
         # set icon
         # Issue. 199、自定詞庫視窗左上角，顯示「肥」Icon        
-        self.custom_UI["win"].set_icon(self.custom_UI["parent"].UCL_PIC_pixbuf)
+        self.win.set_icon(self.parent.UCL_PIC_pixbuf)
 
         # 防最大化視窗大小
-        self.custom_UI["win"].set_resizable(False)
-        self.custom_UI["win"].set_position(gtk.WIN_POS_CENTER)
-        self.custom_UI["win"].connect("destroy", gtk.main_quit)
+        self.win.set_resizable(False)
+        self.win.set_position(gtk.WIN_POS_CENTER)
         # 改用原 uclliu.pyw 全域字型
         #self.GLOBAL_FONT_FAMILY = (
         #    "Segoe UI Symbol,Noto Color Emoji,Arial Unicode MS,Segoe UI Emoji,Mingliu,Serif,Malgun Gothic,Mingliu-ExtB"
         #)
         vbox_main = gtk.VBox(False, 5)
-        self.custom_UI["win"].add(vbox_main)
+        self.win.add(vbox_main)
         vbox_main.set_border_width(5)
 
         # ===== 上方輸入區 =====
@@ -67,36 +176,33 @@ class CustomDictWindow(object):
         vbox_main.pack_start(hbox_input, False, False, 0)
 
         # ===== 輸入字根 =====
-        self.custom_UI["entry_key"] = gtk.Entry()
-        self.custom_UI["entry_key"].set_max_length(5)
-        self.custom_UI["entry_key"].modify_font(
-            pango.FontDescription("Consolas bold 18")
-        )
-        self.custom_UI["entry_key"].set_size_request(120, 50)
-        hbox_input.pack_start(gtk.Label(my18.auto("字根：")), False, False, 0)
-        hbox_input.pack_start(self.custom_UI["entry_key"], False, False, 0)
+        self.entry_key = gtk.Entry()
+        self.entry_key.set_max_length(5)
+        self.entry_key.modify_font(self._fd_entry)
+        self.entry_key.set_size_request(120, 50)
+        hbox_input.pack_start(gtk.Label(LABEL_KEY), False, False, 0)
+        hbox_input.pack_start(self.entry_key, False, False, 0)
         # 當 focus 進入 entry_key 時，如果是「肥模式」，切換回「英文模式」
-        self.custom_UI["entry_key"].connect("focus-in-event", self.focusOn_entry_key)
+        self.entry_key.connect("focus-in-event", self.focusOn_entry_key)
 
         # ===== 輸入出字詞 =====
-        self.custom_UI["text_words"] = gtk.TextView()
-        self.custom_UI["text_words"].set_wrap_mode(gtk.WRAP_WORD)
-        self.custom_UI["text_words"].set_size_request(300, 50)
+        self.text_words = gtk.TextView()
+        self.text_words.set_wrap_mode(gtk.WRAP_WORD)
+        self.text_words.set_size_request(300, 50)
         
-        self.custom_UI["text_words"].set_left_margin(5)
-        self.custom_UI["text_words"].set_right_margin(5)
+        self.text_words.set_left_margin(5)
+        self.text_words.set_right_margin(5)
         # border color #000
-        self.custom_UI["text_words"].set_border_width(5)
-        self.custom_UI["text_words"].set_editable(True)
-        self.custom_UI["text_words"].set_cursor_visible(True)
-        self.custom_UI["text_words"].modify_font(
-            pango.FontDescription("%s 14" % (self.custom_UI["parent"].GLOBAL_FONT_FAMILY))
-        )
+        self.text_words.set_border_width(5)
+        self.text_words.set_editable(True)
+        self.text_words.set_cursor_visible(True)
+        self.text_buffer = self.text_words.get_buffer()
+        self.text_words.modify_font(self._fd_dialog)
 
-        hbox_input.pack_start(gtk.Label(my18.auto("出字詞：")), False, False, 0)
-        hbox_input.pack_start(self.custom_UI["text_words"], True, True, 0)
+        hbox_input.pack_start(gtk.Label(LABEL_WORDS), False, False, 0)
+        hbox_input.pack_start(self.text_words, True, True, 0)
 
-        self.btn_save = gtk.Button(my18.auto("儲存"))
+        self.btn_save = gtk.Button(LABEL_SAVE)
         self.btn_save.connect("clicked", self.on_save_clicked)
         self.btn_save.set_size_request(60, 60)
         hbox_input.pack_start(self.btn_save, False, False, 0)
@@ -107,198 +213,293 @@ class CustomDictWindow(object):
 
         # ===== 表格區 =====
         self.treeview = gtk.TreeView()
-        self.custom_UI["model"] = gtk.ListStore(
-            int, str, str, object
-        )  # step, key, word string, original dict
-        self.treeview.set_model(self.custom_UI["model"])
-
-        for i, col_title in enumerate(
-            [my18.auto("項次"), my18.auto("字根"), my18.auto("字詞(點二下可以編修)")]
-        ):
-            if i == 2:
-                renderer = gtk.CellRendererText()
-                renderer.set_property("font", "%s 12" % (self.custom_UI["parent"].GLOBAL_FONT_FAMILY))
-                column = gtk.TreeViewColumn(col_title, renderer, text=2)
-
-            else:
-                renderer = gtk.CellRendererText()
-                renderer.set_property("font", "%s 12" % (self.custom_UI["parent"].GLOBAL_FONT_FAMILY))
-                column = gtk.TreeViewColumn(col_title, renderer, text=i)
+        self.model = gtk.ListStore(int, str, str)  # step, key, word string
+        self.treeview.set_model(self.model)
+
+        # 三欄共用同一個 renderer，各欄以 text=i 對應 model 的欄位
+        renderer = gtk.CellRendererText()
+        renderer.set_property("font-desc", self._fd_cell)
+        # 固定列高，多行的出字詞以單行顯示（換行顯示成符號）
+        renderer.set_property("single-paragraph-mode", True)
+        for i, col_title in enumerate(COL_TITLES):
+            column = gtk.TreeViewColumn(col_title, renderer, text=i)
+            # 出字詞欄吃掉剩下的寬度
+            column.set_expand(i == 2)
+            column.set_sizing(gtk.TREE_VIEW_COLUMN_FIXED)
+            column.set_fixed_width(COL_WIDTHS[i])
             self.treeview.append_column(column)
+        # 所有欄都是 FIXED 才能開 fixed-height-mode，捲動、顯示只算看得到的列
+        self.treeview.set_fixed_height_mode(True)
+        self.treeview.set_rules_hint(False)
 
         self.treeview.connect("row-activated", self.on_row_activated)
 
         scroll = gtk.ScrolledWindow()
         scroll.set_policy(gtk.POLICY_AUTOMATIC, gtk.POLICY_AUTOMATIC)
+        scroll.set_shadow_type(gtk.SHADOW_IN)
         scroll.add(self.treeview)
         vbox_main.pack_start(scroll, True, True, 0)
 
         self.refresh_table()
-        self.custom_UI["win"].show_all()
+        self.win.show_all()
 
         # return self.win
         # 視窗關閉時，主程式執行 load_word_root
-        self.custom_UI["win"].connect("delete-event", self.on_window_delete_event)
+        self.win.connect("delete-event", self.on_window_delete_event)
         
         # 字根輸入時強制檢查        
-        self.custom_UI["entry_key"].connect(
+        self._entry_changed_id = self.entry_key.connect(
             "changed", self.text_entry_key_changed
         )
 
         # 文字變化時立即刷新，因為載入「Mingliu-ExtB」會造成第一個字顯示異常，只能用這個方法解決
-        self.custom_UI["text_words"].get_buffer().connect(
+        self.text_buffer.connect(
             "changed", self.text_words_key_changed
         )
-        # self.custom_UI["text_words"].queue_draw()
+        # self.text_words.queue_draw()
+
+    def _init_state(self):
+        # 視窗元件以外的狀態，__init__ 與 test/t_custom_dict.py 共用
+        self.data = {}  # 儲存自定字詞的資料
+        self.lastKey = None  # 編輯用
+        self.lastValue = None  # 編輯用
+        self.isEdit = False  # 編輯用
+        self.iters = {}  # (字根, 出字詞) -> TreeIter，表格局部更新用
+        # 有改過才寫回 custom.json，連續的修改合併成一次寫入
+        self._dirty = False
+        self._save_source_id = None
+        # 最後一次讀寫 custom.json 內容的 md5，內容沒變就不重寫
+        self._last_hash = None
+        # 點二下表格時的操作視窗，用到才建立
+        self._action_dialog = None
+        self._action_buttons = {}
+
     def text_entry_key_changed(self, widget):        
-        # 強制 self.custom_UI["entry_key"] 小寫
+        # 強制 self.entry_key 小寫
         current_text = widget.get_text()
         lower_text = my.strtolower(current_text)
-        if current_text != lower_text:
-            widget.set_text(lower_text)
-            # 將游標移到最後
-            widget.set_position(len(lower_text))
         # Issue 197、自定詞庫功能 字根只能允許 a-z,.]['
-        allowed_chars = "abcdefghijklmnopqrstuvwxyz,.]['"
-        filtered_text = ''.join([c for c in lower_text if c in allowed_chars])        
-        if lower_text != filtered_text:
-            widget.set_text(filtered_text)
-            # 將游標移到最後
-            widget.set_position(len(filtered_text))
+        filtered_text = lower_text.translate(None, _DROP_KEY_CHARS)
+        if current_text == filtered_text:
+            return
+        # 程式自己改字時擋掉 changed，不要再重進一次檢查
+        widget.handler_block(self._entry_changed_id)
+        widget.set_text(filtered_text)
+        # 將游標移到最後
+        widget.set_position(len(filtered_text))
+        widget.handler_unblock(self._entry_changed_id)
     def text_words_key_changed(self, widget):
         # 文字變化時立即刷新
-        self.custom_UI["text_words"].queue_draw()
+        self.text_words.queue_draw()
 
     def on_window_delete_event(self, widget, event):
         # print("on_window_delete_event")
         # self.win.hide()
-        self.custom_UI["win"].hide()
+        self.win.hide()
         # self.win.destroy()
-        self.save_data()
-        self.custom_UI["parent"].load_word_root()  # 重新載入字根
+        # 還沒寫的修改在重新載入字根前寫完
+        if self._save_source_id is not None:
+            gobject.source_remove(self._save_source_id)
+            self._save_source_id = None
+        if self._dirty:
+            self.save_data()
+        if self._action_dialog is not None:
+            self._action_dialog.destroy()
+            self._action_dialog = None
+        self.parent.load_word_root()  # 重新載入字根
         # 202、「自定詞庫」最多只能開啟一個視窗，已存在就不顯示
-        self.custom_UI["parent"].tray.my_custom_FLAG = False
+        self.parent.tray.my_custom_FLAG = False
 
     def focusOn_entry_key(self, widget, event):
         # print("focusOn_entry_key")
         # 如果是「肥模式」，切換回「英文模式」
-        print("is_url: %s" % (self.custom_UI["parent"].is_ucl()))
-        if self.custom_UI["parent"].is_ucl():
-            self.custom_UI["parent"].toggle_ucl()
+        print("is_url: %s" % (self.parent.is_ucl()))
+        if self.parent.is_ucl():
+            self.parent.toggle_ucl()
             # 重新 focus 到 entry_key
-            self.custom_UI["entry_key"].grab_focus()
+            self.entry_key.grab_focus()
         # return True # 返回 True 以防止事件繼續傳播
 
     def load_data(self):
         # print("Loading ... CUSTOM_JSON_PATH: %s " % (CUSTOM_JSON_PATH))
-        if my.is_file(CUSTOM_JSON_PATH):
-            content = my.file_get_contents(CUSTOM_JSON_PATH)
-            if content:
-                try:
-                    self.custom_UI["data"] = my.json_decode(content)
-                    # print(self.custom_UI["data"])
-                except ValueError as e:
-                    print("Error loading JSON data: %s" % e)
-                    self.custom_UI["data"] = {}
-            else:
-                self.custom_UI["data"] = {}
+        if os.path.isfile(CUSTOM_JSON_PATH):
+            try:
+                data, self._last_hash = _read_json_file(CUSTOM_JSON_PATH)
+                self.data = data if data is not None else {}
+                # print(self.data)
+            except ValueError as e:
+                print("Error loading JSON data: %s" % e)
+                self.data = {}
         else:
-            self.custom_UI["data"] = {}
+            self.data = {}
         # Issue 196、把所有 key 強制轉小寫
         new_data = {}
-        for key in self.custom_UI["data"]:
+        for key in self.data:
             new_key = my.strtolower(key)
-            if new_key not in new_data:
-                new_data[new_key] = self.custom_UI["data"][key]
-            else:
-                # 如果 new_data 已經有這個 key，則把 value 合併
-                new_data[new_key].extend(self.custom_UI["data"][key])
-                # 去除重複的 value
-                new_data[new_key] = list(set(new_data[new_key]))
+            if new_key != key:
+                # 轉換後的結果要寫回檔案
+                self._dirty = True
+            # 如果 new_data 已經有這個 key，則把 value 合併
+            new_data.setdefault(new_key, []).extend(self.data[key])
+        # 去除重複的 value，但保留使用者排好的順序
+        # 表格以 (字根, 出字詞) 對應每一列，同字根不能有重複的出字詞
+        for key, values in new_data.iteritems():
+            unique_values = list(OrderedDict.fromkeys(values))
+            if len(unique_values) != len(values):
+                new_data[key] = unique_values
+                self._dirty = True
         # 換掉
-        self.custom_UI["data"] = new_data
+        self.data = new_data
+        # 每個字根的出字詞集合，查重複用；順序仍以 data 的 list 為準
+        self._index = dict(
+            (key, set(values)) for key, values in self.data.items()
+        )
 
     def save_data(self):
         # with open(CUSTOM_JSON_PATH, "w", encoding="utf-8") as f:
-        #    json.dump(self.custom_UI["data"], f, ensure_ascii=False, indent=2)
-        my.file_put_contents(
-            CUSTOM_JSON_PATH,
-            my.json_format_utf8(self.custom_UI["data"]),
-            IS_APPEND=False,
-        )
+        #    json.dump(self.data, f, ensure_ascii=False, indent=2)
+        content = _json_dumps(self.data)
+        if isinstance(content, unicode):
+            content = content.encode("utf-8")
+        h = hashlib.md5(content).digest()
+        if h != self._last_hash:
+            # 先寫暫存檔再換掉，寫到一半當掉也不會留下半個 custom.json
+            tmp_path = CUSTOM_JSON_PATH + ".tmp"
+            with open(tmp_path, "wb", IO_BUFFER_SIZE) as f:
+                f.write(content)
+                # 確定落地再換檔，斷電時才不會換成空檔
+                f.flush()
+                os.fsync(f.fileno())
+            _replace_file(tmp_path, CUSTOM_JSON_PATH)
+            self._last_hash = h
+        self._dirty = False
+
+    def schedule_save(self):
+        self._dirty = True
+        if self._save_source_id is None:
+            self._save_source_id = gobject.timeout_add(SAVE_DELAY_MS, self.flush_save)
+
+    def flush_save(self):
+        self._save_source_id = None
+        if self._dirty:
+            self.save_data()
+        return False  # 只執行一次
 
     def refresh_table(self):
-        self.custom_UI["model"].clear()
-        for key in self.custom_UI["data"]:
-            step = 1
-            for value in self.custom_UI["data"][key]:
+        # 只在開窗時整批載入，之後的新增／刪除／移動都走下面的局部更新
+        # 整批載入前先把 model 從 treeview 拆下來，避免每加一列就觸發重算、重繪
+        self.treeview.set_model(None)
+        self.treeview.freeze_child_notify()
+        model = self.model
+        model.clear()
+        iters = self.iters = {}
+        # GTK 2 沒有定義 position = -1 代表加在最後，自己算列號
+        position = 0
+        # Python 2 的 dict 沒有固定順序，依字根排好一次再整批放進表格
+        for key, values in sorted(self.data.iteritems(), key=lambda kv: kv[0]):
+            for step, value in enumerate(values, 1):
                 # print("key: %s, value: %s" % (key, value))
                 # print("type(value): %s" % (type(value)))
-                self.custom_UI["model"].append(
-                    [step, key, value, my18.auto("編輯／刪除")]
-                )
-                step += 1
+                # PyGTK 的 insert(position, row) 直接走 gtk_list_store_insert_with_valuesv，
+                # 不像 append 先插空列再逐欄 set
+                iters[(key, value)] = model.insert(position, [step, key, value])
+                position += 1
+        self.treeview.thaw_child_notify()
+        self.treeview.set_model(model)
+
+    def append_row(self, key, value):
+        # value 已經加進 data[key] 的最後，表格也放在同字根的最後一列之後
+        values = self.data[key]
+        row = [len(values), key, value]
+        if len(values) > 1:
+            prev_iter = self.iters[(key, values[-2])]
+            self.iters[(key, value)] = self.model.insert_after(prev_iter, row)
+        else:
+            # 新的字根，照 refresh_table 的排序插在比它小的字根之後
+            position = sum([len(v) for k, v in self.data.iteritems() if k < key])
+            self.iters[(key, value)] = self.model.insert(position, row)
+
+    def remove_row(self, key, value):
+        # value 已經從 data[key] 移除，表格刪掉該列並重排同字根的項次
+        iter = self.iters.pop((key, value), None)
+        if iter is not None:
+            self.model.remove(iter)
+        for step, v in enumerate(self.data.get(key, []), 1):
+            self.model.set_value(self.iters[(key, v)], 0, step)
+
+    def swap_rows(self, key, i, j):
+        # 同字根的第 i、j 個出字詞互換（0 起算），data 與表格一起換
+        values = self.data[key]
+        iter_i = self.iters[(key, values[i])]
+        iter_j = self.iters[(key, values[j])]
+        values[i], values[j] = values[j], values[i]
+        self.model.swap(iter_i, iter_j)
+        self.model.set_value(iter_i, 0, j + 1)
+        self.model.set_value(iter_j, 0, i + 1)
 
     def on_save_clicked(self, widget):
         # print(self)
         # print(dir(self.self))
         # print(dir(self.entry_key))
-        key = self.custom_UI["entry_key"].get_text()
-        key = my.trim(key)
+        entry = self.entry_key
+        data = self.data
+        index = self._index
+        key = _u(entry.get_text().strip())
         # print(key)
         if key == "":  # 如果沒有輸入字根，則不儲存
             return
-        buf = self.custom_UI["text_words"].get_buffer()
+        buf = self.text_buffer
         start, end = buf.get_bounds()
-        value = buf.get_text(start, end)  # .strip()
+        value = _u(buf.get_text(start, end))  # .strip()
         if value == "":  # 如果沒有輸入出字詞，則不儲存
             return
         # 如果是編輯模式，則照舊的字根和出字詞更新
-        if self.custom_UI["isEdit"]:
+        removed = False
+        if self.isEdit:
             # print("編輯模式")
-            if (
-                self.custom_UI["lastKey"] is not None
-                and self.custom_UI["lastValue"] is not None
-            ):
+            last_key = self.lastKey
+            last_value = self.lastValue
+            if last_key is not None and last_value is not None:
                 # 刪除舊的字根和出字詞
-                if self.custom_UI["lastKey"] in self.custom_UI["data"]:
-                    if (
-                        self.custom_UI["lastValue"]
-                        in self.custom_UI["data"][self.custom_UI["lastKey"]]
-                    ):
-                        self.custom_UI["data"][self.custom_UI["lastKey"]].remove(
-                            self.custom_UI["lastValue"]
-                        )
-                        if self.custom_UI["data"][self.custom_UI["lastKey"]] == []:
-                            del self.custom_UI["data"][self.custom_UI["lastKey"]]
+                if last_key in data:
+                    if last_value in index[last_key]:
+                        data[last_key].remove(last_value)
+                        index[last_key].discard(last_value)
+                        removed = True
+                        self.remove_row(last_key, last_value)
+                        if data[last_key] == []:
+                            del data[last_key]
+                            del index[last_key]
         # 結束編輯模式
-        self.custom_UI["isEdit"] = False
-        self.custom_UI["lastKey"] = None
-        self.custom_UI["lastValue"] = None
+        self.isEdit = False
+        self.lastKey = None
+        self.lastValue = None
 
         # 如果字根已存在，則更新出字詞
-        if key not in self.custom_UI["data"]:
-            self.custom_UI["data"][key] = []
+        if key not in data:
+            data[key] = []
         # 如果出字詞已存在，則不重複添加
-        if value in self.custom_UI["data"][key]:
-            self.save_data()
-            self.refresh_table()
-            self.custom_UI["entry_key"].set_text("")
+        if value in index.setdefault(key, set()):
+            # 資料沒有變動就不用寫檔
+            if removed:
+                self.schedule_save()
+            entry.set_text("")
             buf.set_text("")
             return
 
-        self.custom_UI["data"][key].append(value)
-        # print(my.json_encode(self.custom_UI["data"]))
-        self.save_data()
-        self.refresh_table()
-        self.custom_UI["entry_key"].set_text("")
+        data[key].append(value)
+        index[key].add(value)
+        self.append_row(key, value)
+        # print(my.json_encode(data))
+        self.schedule_save()
+        entry.set_text("")
         buf.set_text("")
 
-    def set_dialog_label_font(self, dialog, font_str):
+    def set_dialog_label_font(self, dialog, font_desc):
         def find_label(widget):
             if isinstance(widget, gtk.Label):
                 #widget.set_property("font", font_str)                
-                widget.modify_font(pango.FontDescription(font_str))
+                widget.modify_font(font_desc)
                 #print(font_str)
             elif isinstance(widget, gtk.Container):
                 for child in widget.get_children():
@@ -306,95 +507,105 @@ class CustomDictWindow(object):
 
         find_label(dialog)
 
+    def get_action_dialog(self):
+        # 第一次點二下才建立，之後只換文字、切換上移／下移按鈕，關掉時 hide 不 destroy
+        if self._action_dialog is None:
+            dialog = gtk.MessageDialog(
+                # self.win,
+                None,
+                gtk.DIALOG_MODAL,
+                gtk.MESSAGE_QUESTION,
+                gtk.BUTTONS_NONE,
+                "",
+            )
+
+            dialog.set_position(gtk.WIN_POS_CENTER_ALWAYS)  # Always center the dialog
+
+            # gtk.RESPONSE 順序左到右參考:
+            # https://developer.gnome.org/gtk3/stable/gtk3-Dialog-Buttons.html#gtk-response-type-enum
+            # 1. gtk.RESPONSE_HELP # 編輯
+            # 2. gtk.RESPONSE_YES  # 刪除
+            # 3. gtk.RESPONSE_NO   # 上移
+            # 4. gtk.RESPONSE_APPLY # 下移
+            # 5. gtk.RESPONSE_CANCEL # 取消
+            # 6. gtk.RESPONSE_CLOSE
+            self._action_buttons = {}
+            for label, response in (
+                (LABEL_EDIT, gtk.RESPONSE_HELP),
+                (LABEL_DELETE, gtk.RESPONSE_YES),
+                (LABEL_MOVE_UP, gtk.RESPONSE_NO),
+                (LABEL_MOVE_DOWN, gtk.RESPONSE_APPLY),
+                (LABEL_CANCEL, gtk.RESPONSE_CANCEL),
+            ):
+                self._action_buttons[response] = dialog.add_button(label, response)
+
+            # Change font
+            dialog.realize()
+            self.set_dialog_label_font(dialog, self._fd_dialog)
+            self._action_dialog = dialog
+        return self._action_dialog
+
     def on_row_activated(self, treeview, path, column):
         model = treeview.get_model()
         iter = model.get_iter(path)
         step = model.get_value(iter, 0)
-        key = model.get_value(iter, 1)        
-        val = model.get_value(iter, 2)        
-
-        dialog = gtk.MessageDialog(
-            # self.custom_UI["win"],
-            None,
-            gtk.DIALOG_MODAL,
-            gtk.MESSAGE_QUESTION,
-            gtk.BUTTONS_NONE,
-            "%s%s %s%s"
-            % (my18.auto("請選擇要對「"), key, val, my18.auto("」做什麼？")),
-        )        
-
-        dialog.set_position(gtk.WIN_POS_CENTER_ALWAYS)  # Always center the dialog
-
-        # gtk.RESPONSE 順序左到右參考:
-        # https://developer.gnome.org/gtk3/stable/gtk3-Dialog-Buttons.html#gtk-response-type-enum
-        # 1. gtk.RESPONSE_HELP # 編輯
-        # 2. gtk.RESPONSE_YES  # 刪除
-        # 3. gtk.RESPONSE_NO   # 上移
-        # 4. gtk.RESPONSE_APPLY # 下移
-        # 5. gtk.RESPONSE_CANCEL # 取消
-        # 6. gtk.RESPONSE_CLOSE
-
-        dialog.add_button(my18.auto("編輯"), gtk.RESPONSE_HELP)
-        dialog.add_button(my18.auto("刪除"), gtk.RESPONSE_YES)
-        # 如果 data[key] 的長度大於 1 ，可以上移 或下移 調整排序
-        if len(self.custom_UI["data"][key]) > 1 and step == 1:
-            dialog.add_button(my18.auto("下移"), gtk.RESPONSE_APPLY)
-        elif len(self.custom_UI["data"][key]) > 1 and step == len(
-            self.custom_UI["data"][key]
-        ):
-            dialog.add_button(my18.auto("上移"), gtk.RESPONSE_NO)
-        elif len(self.custom_UI["data"][key]) > 1 and step < len(
-            self.custom_UI["data"][key]
-        ):
-            dialog.add_button(my18.auto("上移"), gtk.RESPONSE_NO)
-            dialog.add_button(my18.auto("下移"), gtk.RESPONSE_APPLY)
-        else:
-            # 如果只有一個出字詞，則不顯示上移或下移按鈕
-            pass
+        key = _u(model.get_value(iter, 1))
+        val = _u(model.get_value(iter, 2))
 
-        dialog.add_button(my18.auto("取消"), gtk.RESPONSE_CANCEL)
+        data = self.data
+        lst = data[key]
+        n = len(lst)
 
-        # Change font
-        dialog.realize()
-        self.set_dialog_label_font(dialog, "%s 14" % self.custom_UI["parent"].GLOBAL_FONT_FAMILY)
+        dialog = self.get_action_dialog()
+        dialog.set_property(
+            "text", "%s%s %s%s" % (LABEL_PROMPT_PRE, key, val, LABEL_PROMPT_POST)
+        )
+        # 如果 data[key] 的長度大於 1 ，可以上移 或下移 調整排序
+        # 如果只有一個出字詞，則不顯示上移或下移按鈕
+        if n > 1 and step > 1:
+            self._action_buttons[gtk.RESPONSE_NO].show()
+        else:
+            self._action_buttons[gtk.RESPONSE_NO].hide()
+        if n > 1 and step < n:
+            self._action_buttons[gtk.RESPONSE_APPLY].show()
+        else:
+            self._action_buttons[gtk.RESPONSE_APPLY].hide()
 
-        response = dialog.run()        
+        response = dialog.run()
 
-        dialog.destroy()
+        dialog.hide()
 
         if response == gtk.RESPONSE_HELP:
             # 編輯模式
-            self.custom_UI["lastKey"] = key
-            self.custom_UI["lastValue"] = val
-            self.custom_UI["isEdit"] = True
+            self.lastKey = key
+            self.lastValue = val
+            self.isEdit = True
 
-            self.custom_UI["entry_key"].set_text(key)
-            buf = self.custom_UI["text_words"].get_buffer()
-            buf.set_text(val)
+            self.entry_key.set_text(key)
+            self.text_buffer.set_text(val)
         elif response == gtk.RESPONSE_YES:
             # 刪除
-            for i in range(len(self.custom_UI["data"][key])):
-                if self.custom_UI["data"][key][i] == val:
-                    del self.custom_UI["data"][key][i]
-                    break
-
-            self.save_data()
-            self.refresh_table()
+            try:
+                lst.remove(val)
+            except ValueError:
+                pass
+            self._index[key].discard(val)
+            self.remove_row(key, val)
+            # 跟編輯模式一樣，字根沒有出字詞了就整個拿掉
+            if lst == []:
+                del data[key]
+                del self._index[key]
+
+            self.schedule_save()
         elif response == gtk.RESPONSE_NO:
             # 上移
             if step > 1:
                 # print("上移")
-                self.custom_UI["data"][key].insert(
-                    step - 2, self.custom_UI["data"][key].pop(step - 1)
-                )
-                self.save_data()
-                self.refresh_table()
+                self.swap_rows(key, step - 1, step - 2)
+                self.schedule_save()
         elif response == gtk.RESPONSE_APPLY:
             # 下移
-            if step < len(self.custom_UI["data"][key]):
+            if step < n:
                 # print("下移")
-                self.custom_UI["data"][key].insert(
-                    step, self.custom_UI["data"][key].pop(step - 1)
-                )
-                self.save_data()
-                self.refresh_table()
+                self.swap_rows(key, step - 1, step)
+                self.schedule_save()
@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+# 自定詞庫表格局部更新檢查：custom.json 裡同字根有重複出字詞時，刪除、移動、編輯後表格要跟 data 一致
+# 用法(Python 2)：python test/t_custom_dict.py
+import os
+import sys
+import types
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+
+class Dummy(object):
+    # 不在意的 GTK 物件，任何方法都吃
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: None
+
+
+class FakeListStore(object):
+    # 只做 custom_dict_window 用到的 ListStore 方法，iter 就是 row 本身（跟 GTK 一樣持久）
+    def __init__(self):
+        self.rows = []
+
+    def clear(self):
+        self.rows = []
+
+    def insert(self, position, row):
+        row = list(row)
+        if position < 0:
+            self.rows.append(row)
+        else:
+            self.rows.insert(position, row)
+        return row
+
+    def insert_after(self, sibling, row):
+        row = list(row)
+        self.rows.insert(self.rows.index(sibling) + 1, row)
+        return row
+
+    def remove(self, iter):
+        self.rows.remove(iter)
+
+    def swap(self, a, b):
+        i, j = self.rows.index(a), self.rows.index(b)
+        self.rows[i], self.rows[j] = self.rows[j], self.rows[i]
+
+    def set_value(self, iter, column, value):
+        iter[column] = value
+
+    def get_iter(self, path):
+        return self.rows[path[0]]
+
+    def get_value(self, iter, column):
+        value = iter[column]
+        # PyGTK 取回的是 utf-8 str
+        if isinstance(value, unicode):
+            value = value.encode("utf-8")
+        return value
+
+    def table(self):
+        return [(r[0], r[1], r[2]) for r in self.rows]
+
+
+class FakeTreeView(Dummy):
+    def __init__(self, model):
+        self.model = model
+
+    def get_model(self):
+        return self.model
+
+
+class FakeDialog(Dummy):
+    response = None
+
+    def run(self):
+        return self.response
+
+
+class FakeEntry(Dummy):
+    text = ""
+
+    def get_text(self):
+        return self.text
+
+    def set_text(self, text):
+        self.text = text
+
+
+class FakeBuffer(FakeEntry):
+    def get_bounds(self):
+        return None, None
+
+    def get_text(self, start, end):
+        return self.text
+
+
+gtk = types.ModuleType("gtk")
+gtk.RESPONSE_HELP, gtk.RESPONSE_YES, gtk.RESPONSE_NO = -11, -8, -9
+gtk.RESPONSE_APPLY, gtk.RESPONSE_CANCEL = -10, -6
+gobject = types.ModuleType("gobject")
+gobject.timeout_add = lambda ms, func: 1
+gobject.source_remove = lambda source_id: True
+sys.modules["gtk"] = gtk
+sys.modules["gobject"] = gobject
+sys.modules["pango"] = types.ModuleType("pango")
+
+import custom_dict_window
+
+
+def open_window(content):
+    fd, path = tempfile.mkstemp(suffix=".json")
+    os.write(fd, content)
+    os.close(fd)
+    custom_dict_window.CUSTOM_JSON_PATH = path
+    w = custom_dict_window.CustomDictWindow.__new__(custom_dict_window.CustomDictWindow)
+    w._init_state()
+    w.load_data()
+    os.remove(path)
+    w.model = FakeListStore()
+    w.treeview = FakeTreeView(w.model)
+    w.entry_key = FakeEntry()
+    w.text_buffer = FakeBuffer()
+    w._action_dialog = FakeDialog()
+    w._action_buttons = dict(
+        (r, Dummy())
+        for r in (gtk.RESPONSE_HELP, gtk.RESPONSE_YES, gtk.RESPONSE_NO, gtk.RESPONSE_APPLY, gtk.RESPONSE_CANCEL)
+    )
+    w.refresh_table()
+    return w
+
+
+def click(w, row, response):
+    w._action_dialog.response = response
+    w.on_row_activated(w.treeview, (row,), None)
+
+
+def check(w, expected):
+    rows = []
+    for key in sorted(w.data):
+        for step, value in enumerate(w.data[key], 1):
+            rows.append((step, key, value))
+    assert w.model.table() == rows, (w.model.table(), rows)
+    assert w.data == expected, (w.data, expected)
+    for key, values in w.data.items():
+        # 同字根的出字詞不能重複，集合才能跟 list 一一對應
+        assert len(set(values)) == len(values), (key, values)
+        assert w._index[key] == set(values), (key, w._index[key], values)
+
+
+w = open_window('{"a": ["x", "y", "x"], "c": ["w"], "C": ["w", "v"]}')
+check(w, {u"a": [u"x", u"y"], u"c": [u"w", u"v"]})
+assert w._dirty
+# 刪除第 1 列 a/x
+click(w, 0, gtk.RESPONSE_YES)
+check(w, {u"a": [u"y"], u"c": [u"w", u"v"]})
+# 第 3 列 c/v 上移
+click(w, 2, gtk.RESPONSE_NO)
+check(w, {u"a": [u"y"], u"c": [u"v", u"w"]})
+# 第 2 列 c/v 下移
+click(w, 1, gtk.RESPONSE_APPLY)
+check(w, {u"a": [u"y"], u"c": [u"w", u"v"]})
+# 編輯第 1 列 a/y -> x
+click(w, 0, gtk.RESPONSE_HELP)
+w.text_buffer.set_text("x")
+w.on_save_clicked(None)
+check(w, {u"a": [u"x"], u"c": [u"w", u"v"]})
+# 新增，再存一次已存在的出字詞，不能多出一份
+for i in range(2):
+    w.entry_key.set_text("a")
+    w.text_buffer.set_text("z")
+    w.on_save_clicked(None)
+    check(w, {u"a": [u"x", u"z"], u"c": [u"w", u"v"]})
+# 刪光整個字根
+click(w, 0, gtk.RESPONSE_YES)
+click(w, 0, gtk.RESPONSE_YES)
+check(w, {u"c": [u"w", u"v"]})
+
+# 沒有重複、也不用轉小寫的檔案，載入後不需要寫回
+w = open_window('{"b": ["x", "y"]}')
+assert not w._dirty
+print("ok")
@@ -79,7 +79,7 @@ my18 = myi18n.kit()
 # 2025-08-03 加入自定詞庫畫面
 import copy # 用於複製自定詞庫
 import custom_dict_window
-CUSTOM_JSON_PATH = "%s\\custom.json" % PWD
+CUSTOM_JSON_PATH = custom_dict_window.CUSTOM_JSON_PATH # 路徑只在 custom_dict_window 定義一次
 
 
 #print my18.auto('test')